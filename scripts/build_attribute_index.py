@@ -0,0 +1,125 @@
+import argparse
+import struct
+import json
+import os
+from pathlib import Path
+
+# Sharded building-attribute index.
+#
+# optimize_b3dm.py strips the batch tables down to oorspronkelijkbouwjaar and
+# identificatie, so this has to run on the original tiles first. Every
+# building's full 3DBAG attributes end up in exactly one small shard file,
+# picked by a fixed-width prefix of the FNV-1a hash of its identificatie:
+#   {DATA_DIR}/building_attributes/{prefix}.json  ->  {identificatie: {...}, ...}
+# A click in BuildingInformation then only needs to fetch a single shard.
+# Override with DATA_DIR or --data-dir, so fixture runs don't end up in data/
+DATA_DIR = Path(os.environ.get("DATA_DIR", "data"))
+OUTPUT_DIR = DATA_DIR / "building_attributes"
+PREFIX_LENGTH = 3 # Hex chars, 4096 shards
+
+# Already in every tile, no need to duplicate them in the index
+SKIPPED_KEYS = ["identificatie"]
+
+def fnv1a_32(text):
+    # Cheap to reimplement in the browser, unlike md5/sha
+    h = 0x811c9dc5
+    for byte in text.encode('utf-8'):
+        h ^= byte
+        h = (h * 0x01000193) & 0xffffffff
+    return h
+
+def get_shard_key(identificatie):
+    return f"{fnv1a_32(identificatie):08x}"[:PREFIX_LENGTH]
+
+def read_attributes(file_path):
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    if data[0:4] != b'b3dm':
+        print(f"Skipping {file_path}: Not a b3dm file.")
+        return []
+
+    ft_json_len = struct.unpack('<I', data[12:16])[0]
+    ft_bin_len = struct.unpack('<I', data[16:20])[0]
+    bt_json_len = struct.unpack('<I', data[20:24])[0]
+
+    if bt_json_len == 0:
+        return []
+
+    bt_json_start = 28 + ft_json_len + ft_bin_len
+    try:
+        bt_json = json.loads(data[bt_json_start:bt_json_start + bt_json_len].decode('utf-8'))
+    except Exception as e:
+        print(f"Error parsing BT JSON in {file_path}: {e}")
+        return []
+
+    attributes = []
+    for attr in bt_json.get('attributes', []):
+        # Attributes may be JSON stringified, same as in optimize_b3dm.py
+        obj = attr
+        if isinstance(attr, str):
+            try:
+                obj = json.loads(attr)
+            except:
+                continue
+        if isinstance(obj, dict):
+            attributes.append(obj)
+    return attributes
+
+def build_index(path, output_dir=OUTPUT_DIR):
+    shards = {}
+    file_count = 0
+    stripped_count = 0
+
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            if not file.endswith(".b3dm"):
+                continue
+            file_count += 1
+            for obj in read_attributes(os.path.join(root, file)):
+                identificatie = obj.get('identificatie')
+                if not identificatie:
+                    continue
+                entry = {k: v for k, v in obj.items() if k not in SKIPPED_KEYS}
+                if set(entry.keys()) <= {'oorspronkelijkbouwjaar'}:
+                    # Already ran through optimize_b3dm.py, nothing to index
+                    stripped_count += 1
+                    continue
+                shards.setdefault(get_shard_key(identificatie), {})[identificatie] = entry
+
+    if stripped_count > 0:
+        print(f"Warning: {stripped_count} buildings had no attributes left, their tiles were already optimized. "
+              f"Their entries from earlier runs are kept; run this before optimize_b3dm.py to index new ones.")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    building_count = 0
+    for key, shard in shards.items():
+        # Keep buildings indexed by earlier runs, whose tiles have been
+        # optimized since and are skipped by the downloads
+        shard_path = output_dir / f"{key}.json"
+        if shard_path.exists():
+            with open(shard_path, 'r') as f:
+                shard = {**json.load(f), **shard}
+        # Sorted keys keep the output stable between runs
+        with open(shard_path, 'w') as f:
+            json.dump(shard, f, separators=(',', ':'), sort_keys=True)
+        building_count += len(shard)
+
+    with open(output_dir / "index.json", 'w') as f:
+        json.dump({"hash": "fnv1a32", "prefixLength": PREFIX_LENGTH}, f, indent=2)
+
+    print(f"Indexed {building_count} buildings from {file_count} tiles into {len(shards)} shards in {output_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the sharded building-attribute index from 3DBAG tiles.")
+    parser.add_argument("tiles_directory", help="Folder with the original (not yet optimized) b3dm tiles")
+    parser.add_argument("--data-dir", default=None,
+                        help=f"Folder to write building_attributes into (default: {DATA_DIR})")
+    args = parser.parse_args()
+
+    output_dir = Path(args.data_dir) / "building_attributes" if args.data_dir else OUTPUT_DIR
+    build_index(args.tiles_directory, output_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import argparse
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+try:
+    from download_basemap import get_tile_matrix_set, parse_tile_matrices, TILE_MATRIX_SET
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).parent))
+    from download_basemap import get_tile_matrix_set, parse_tile_matrices, TILE_MATRIX_SET
+
+# Storyline prefetch manifest.
+#
+# For every storyline chapter this places a camera the same way
+# animateCameraToLocation (src/utils/cameraAnimations.ts) does, casts rays
+# through the screen onto the ground and lists the basemap tiles and 3D tile
+# contents that view needs, nearest to the chapter's target first. The client
+# can then preload chapter N+1 while chapter N is animating. Basemap tiles are
+# picked with the same algorithm as the terrain renderer, see get_basemap_tiles.
+#
+# The storyline events are read from a JSON file, a list of
+#   {"year": 1650, "coordinate": {"lat": .., "lng": ..} or {"x": .., "y": ..},
+#    "cameraAngle": 180, "cameraDistance": 800}
+# Events without a coordinate (e.g. the ending text) get an empty entry.
+
+# Camera, matching useThreeScene.ts
+CAMERA_FOV = 50 # Vertical, degrees
+CAMERA_NEAR = 2
+CAMERA_FAR = 10000000
+# Terrain tiles, matching TilesRenderer.resFactor and the limits in
+# BaseTileScheme.getTilesInView / growRegion (src/terrain-tiles/base)
+RES_FACTOR = 4.5
+MAX_TILES = 300
+GROW_LIMIT = MAX_TILES + 50
+GROW_MAX_STEPS = 2000
+GROW_MAX_ATTEMPTS = 5
+# ThreeViewer.updateTilesAndMaterials lowers errorTarget to 10 once the map is
+# usable, which is when storylines run (useTilesLoader's 25 is only the start)
+ERROR_TARGET = 10
+DEFAULT_DISTANCE = 600
+DEFAULT_ANGLED_RADIUS = 850
+
+def wgs84_to_rd(latitude, longitude):
+    # Same approximation as wgs84ToRd in src/utils/coords.ts
+    d_lat = 0.36 * (latitude - 52.15517440)
+    d_lon = 0.36 * (longitude - 5.38720621)
+
+    x = (155000
+         + 190094.945 * d_lon
+         - 11832.228 * d_lat * d_lon
+         - 114.221 * d_lat ** 2 * d_lon
+         - 32.391 * d_lon ** 3
+         - 0.705 * d_lat
+         - 2.340 * d_lat ** 3 * d_lon
+         - 0.608 * d_lat * d_lon ** 3)
+    y = (463000
+         + 309056.544 * d_lat
+         + 3638.893 * d_lon ** 2
+         - 157.984 * d_lat * d_lon ** 2
+         + 72.971 * d_lat ** 2
+         + 59.797 * d_lat ** 3
+         - 6.434 * d_lat ** 2 * d_lon ** 2
+         + 0.093 * d_lon ** 4)
+    return x, y
+
+def get_target_rd(coordinate):
+    if "lat" in coordinate and "lng" in coordinate:
+        return wgs84_to_rd(coordinate["lat"], coordinate["lng"])
+
+    x, y = coordinate["x"], coordinate["y"]
+    # Lat/long passed as x/y, same check as animateCameraToStoryline
+    if abs(x) < 1000 and abs(y) < 1000:
+        if x > 40 and y < 20:
+            return wgs84_to_rd(x, y)
+        return wgs84_to_rd(y, x)
+    return x, y
+
+def get_camera_position(target, camera_angle=None, camera_distance=None):
+    # RD coordinates with z up. In the three.js scene -Z is north, so a world
+    # z offset of +r is r metres south (-y) in RD.
+    tx, ty = target
+    if camera_angle is not None:
+        rad = math.radians(camera_angle)
+        radius = camera_distance if camera_distance else DEFAULT_ANGLED_RADIUS
+        height = camera_distance * 0.7 if camera_distance else DEFAULT_DISTANCE
+        return (tx - radius * math.sin(rad), ty - radius * math.cos(rad), height)
+
+    dist = camera_distance if camera_distance else DEFAULT_DISTANCE
+    return (tx + dist, ty - dist, dist)
+
+def normalize(v):
+    length = math.sqrt(v[0] ** 2 + v[1] ** 2 + v[2] ** 2)
+    return (v[0] / length, v[1] / length, v[2] / length)
+
+def cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+def get_camera_basis(camera, target):
+    # The camera looks at the target on the ground, with z up
+    forward = normalize((target[0] - camera[0], target[1] - camera[1], -camera[2]))
+    right = normalize(cross(forward, (0, 0, 1)))
+    up = cross(right, forward)
+    return forward, right, up
+
+def cast_ground_rays(camera, target, width, height, samples_x, samples_y, max_range):
+    # Returns (x, y, range) for a grid of rays through the screen. Rays above
+    # the horizon or beyond max_range are cut off at max_range along the ground.
+    forward, right, up = get_camera_basis(camera, target)
+
+    tan_v = math.tan(math.radians(CAMERA_FOV) / 2)
+    tan_h = tan_v * width / height
+
+    hits = []
+    for i in range(samples_x):
+        sx = (i / (samples_x - 1)) * 2 - 1
+        for j in range(samples_y):
+            sy = (j / (samples_y - 1)) * 2 - 1
+            d = tuple(forward[k] + sx * tan_h * right[k] + sy * tan_v * up[k] for k in range(3))
+            length = math.sqrt(d[0] ** 2 + d[1] ** 2 + d[2] ** 2)
+            t = -camera[2] / d[2] if d[2] < 0 else math.inf
+            if t * length > max_range:
+                horizontal = math.sqrt(d[0] ** 2 + d[1] ** 2)
+                if horizontal == 0:
+                    continue
+                hits.append((camera[0] + d[0] / horizontal * max_range,
+                             camera[1] + d[1] / horizontal * max_range,
+                             max_range))
+            else:
+                hits.append((camera[0] + d[0] * t, camera[1] + d[1] * t, t * length))
+    return hits
+
+def convex_hull(points):
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+
+    def half(pts):
+        hull = []
+        for p in pts:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (p[1] - hull[-2][1]) -
+                                      (hull[-1][1] - hull[-2][1]) * (p[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(p)
+        return hull
+
+    lower = half(points)
+    upper = half(reversed(points))
+    return lower[:-1] + upper[:-1]
+
+def polygons_intersect(a, b):
+    # Separating axis test for two convex polygons
+    for polygon in (a, b):
+        for i in range(len(polygon)):
+            p1 = polygon[i]
+            p2 = polygon[(i + 1) % len(polygon)]
+            axis = (p1[1] - p2[1], p2[0] - p1[0])
+            a_proj = [axis[0] * p[0] + axis[1] * p[1] for p in a]
+            b_proj = [axis[0] * p[0] + axis[1] * p[1] for p in b]
+            if max(a_proj) < min(b_proj) or max(b_proj) < min(a_proj):
+                return False
+    return True
+
+def sphere_in_frustum(center, radius, camera, basis, tan_h, tan_v):
+    # Same as three.js Frustum.intersectsSphere: the sphere is culled only
+    # when it lies entirely outside one of the six planes
+    forward, right, up = basis
+    p = tuple(center[k] - camera[k] for k in range(3))
+    depth = sum(p[k] * forward[k] for k in range(3))
+    x = sum(p[k] * right[k] for k in range(3))
+    y = sum(p[k] * up[k] for k in range(3))
+    distances = [
+        depth - CAMERA_NEAR,
+        CAMERA_FAR - depth,
+        (depth * tan_h - x) / math.sqrt(1 + tan_h ** 2),
+        (depth * tan_h + x) / math.sqrt(1 + tan_h ** 2),
+        (depth * tan_v - y) / math.sqrt(1 + tan_v ** 2),
+        (depth * tan_v + y) / math.sqrt(1 + tan_v ** 2),
+    ]
+    return all(distance >= -radius for distance in distances)
+
+def grow_region(matrix, center_tile, camera, basis, tan_h, tan_v):
+    # Port of BaseTileScheme.growRegion, including its quirks: the queue is
+    # used as a stack, the centre tile is never marked visited (so it can be
+    # listed twice) and growing stops early at GROW_LIMIT tiles
+    radius = max(matrix["tile_span_x"], matrix["tile_span_y"])
+    visited = set()
+    queue = [center_tile]
+    tiles = [center_tile]
+    steps = 0
+    while queue:
+        col, row = queue.pop()
+        for i in (-1, 0, 1):
+            for j in (-1, 0, 1):
+                if i == 0 and j == 0:
+                    continue
+                tile = (col + i, row + j)
+                if tile in visited:
+                    continue
+                visited.add(tile)
+                center = (matrix["top_left_x"] + (tile[0] + 0.5) * matrix["tile_span_x"],
+                          matrix["top_left_y"] - (tile[1] + 0.5) * matrix["tile_span_y"],
+                          0)
+                if sphere_in_frustum(center, radius, camera, basis, tan_h, tan_v):
+                    queue.append(tile)
+                    tiles.append(tile)
+
+        steps += 1
+        if len(tiles) > GROW_LIMIT or steps > GROW_MAX_STEPS:
+            break
+    return tiles
+
+def get_basemap_tiles(matrices, camera, target, width, height):
+    # Port of BaseTileScheme.getTilesInView: one tile matrix for the whole
+    # view, picked from the distance to the ground under the centre of the
+    # screen, then grown over the frustum from the tile there. Returns
+    # (level, col, row) with the level as the client numbers it, the index of
+    # the matrix in the capabilities.
+    levels = list(matrices.values())
+    basis = get_camera_basis(camera, target)
+    forward = basis[0]
+    if forward[2] >= 0:
+        return []
+    t = -camera[2] / forward[2]
+    center = (camera[0] + forward[0] * t, camera[1] + forward[1] * t)
+
+    # First (coarsest) matrix with a scale denominator below distance * resFactor
+    level = next((i for i, m in enumerate(levels) if m["scale_denom"] < t * RES_FACTOR), len(levels) - 1)
+
+    tan_v = math.tan(math.radians(CAMERA_FOV) / 2)
+    tan_h = tan_v * width / height
+
+    tiles = []
+    attempts = 0
+    while attempts < GROW_MAX_ATTEMPTS:
+        matrix = levels[level]
+        grown_level = level
+        center_tile = (math.floor((center[0] - matrix["top_left_x"]) / matrix["tile_span_x"]),
+                       math.floor((matrix["top_left_y"] - center[1]) / matrix["tile_span_y"]))
+        tiles = grow_region(matrix, center_tile, camera, basis, tan_h, tan_v)
+        if len(tiles) <= MAX_TILES:
+            break
+        # Too many tiles, try the next coarser matrix
+        if level > 0:
+            level -= 1
+            attempts += 1
+        else:
+            break
+
+    # The renderer skips tiles outside the matrix and loads duplicates once
+    matrix = levels[grown_level]
+    result = {}
+    for col, row in tiles:
+        if not (0 <= col < matrix["matrix_width"] and 0 <= row < matrix["matrix_height"]):
+            continue
+        x = matrix["top_left_x"] + (col + 0.5) * matrix["tile_span_x"]
+        y = matrix["top_left_y"] - (row + 0.5) * matrix["tile_span_y"]
+        result[(grown_level, col, row)] = math.hypot(x - target[0], y - target[1])
+    return sorted(result.items(), key=lambda item: item[1])
+
+def get_content_tiles(tileset, camera, target, footprint, screen_height, error_target=ERROR_TARGET):
+    # Walks the tileset like the 3D tiles renderer: a node is visible when its
+    # box overlaps the ground footprint, and refined while its screen space
+    # error exceeds error_target or it has no content of its own.
+    root = tileset["root"]
+    transform = root.get("transform", [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1])
+    offset_x, offset_y = transform[12], transform[13]
+    sse_factor = screen_height / (2 * math.tan(math.radians(CAMERA_FOV) / 2))
+
+    contents = {}
+
+    def visit(node, parent_refine):
+        box = node.get("boundingVolume", {}).get("box")
+        if box is None:
+            return
+        cx, cy = box[0] + offset_x, box[1] + offset_y
+        rx, ry = abs(box[3]) + abs(box[6]), abs(box[4]) + abs(box[7])
+        rect = [(cx - rx, cy - ry), (cx + rx, cy - ry), (cx + rx, cy + ry), (cx - rx, cy + ry)]
+        if not polygons_intersect(rect, footprint):
+            return
+
+        # Distance from the camera to the nearest point of the box
+        dx = max(abs(camera[0] - cx) - rx, 0)
+        dy = max(abs(camera[1] - cy) - ry, 0)
+        dz = max(abs(camera[2] - box[2]) - abs(box[11]), 0)
+        distance = max(math.sqrt(dx ** 2 + dy ** 2 + dz ** 2), 1)
+        sse = node.get("geometricError", 0) * sse_factor / distance
+
+        refine = node.get("refine", parent_refine)
+        children = node.get("children", [])
+        content = node.get("content")
+        # Tiles without content have nothing to draw, so the renderer always
+        # refines past them
+        refining = children and (sse > error_target or not content)
+
+        if content and (refine == "ADD" or not refining):
+            uri = content.get("uri", content.get("url"))
+            if uri:
+                contents[uri] = min(contents.get(uri, math.inf), math.hypot(cx - target[0], cy - target[1]))
+
+        if refining:
+            for child in children:
+                visit(child, refine)
+
+    visit(root, root.get("refine", "REPLACE"))
+    return sorted(contents.items(), key=lambda item: item[1])
+
+def load_storyline(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("storylines", data.get("events", []))
+    return data
+
+def build_manifest(events, matrices, tileset, layer, tileset_url, args):
+    tileset_base = tileset_url.rsplit("/", 1)[0]
+    chapters = []
+    for index, event in enumerate(events):
+        chapter = {"index": index, "year": event.get("year"), "basemap": [], "tiles": []}
+        chapters.append(chapter)
+        if not event.get("coordinate"):
+            continue
+
+        target = get_target_rd(event["coordinate"])
+        camera = get_camera_position(target, event.get("cameraAngle"), event.get("cameraDistance"))
+        hits = cast_ground_rays(camera, target, args.width, args.height, args.samples_x, args.samples_y, args.max_range)
+        footprint = convex_hull([(x, y) for x, y, _ in hits])
+        chapter["target"] = {"x": round(target[0], 2), "y": round(target[1], 2)}
+
+        for (level, col, row), _ in get_basemap_tiles(matrices, camera, target, args.width, args.height):
+            chapter["basemap"].append(f"/basemap/tiles/{layer}/{level:02d}/{col}/{row}.png")
+
+        if tileset is not None and len(footprint) >= 3:
+            for uri, _ in get_content_tiles(tileset, camera, target, footprint, args.height, args.error_target):
+                chapter["tiles"].append(f"{tileset_base}/{uri}")
+
+        print(f"Chapter {index} ({event.get('year')}): {len(chapter['basemap'])} basemap tiles, {len(chapter['tiles'])} 3D tiles")
+
+    return {"layer": layer, "tileset": tileset_url, "chapters": chapters}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build a per-chapter prefetch manifest from the storyline events.")
+    parser.add_argument("storyline", help="JSON file with the storyline events")
+    parser.add_argument("--capabilities", default="data/basemap/capabilities.xml")
+    parser.add_argument("--tileset", default="data/amsterdam_3dtiles_lod12/tileset.json")
+    parser.add_argument("--tileset-url", default="/amsterdam_3dtiles_lod12/tileset.json",
+                        help="URL the client loads the tileset from, used to prefix content URIs")
+    parser.add_argument("--layer", default="grijs")
+    parser.add_argument("--output", default="data/prefetch_manifest.json")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument("--samples-x", type=int, default=48, help="Rays per screen row")
+    parser.add_argument("--samples-y", type=int, default=27, help="Rays per screen column")
+    parser.add_argument("--max-range", type=float, default=10000, help="Ignore ground further than this (m)")
+    parser.add_argument("--error-target", type=float, default=ERROR_TARGET,
+                        help="3D tiles renderer errorTarget during storylines")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    root = ET.parse(args.capabilities).getroot()
+    tms_element = get_tile_matrix_set(root)
+    if tms_element is None:
+        print(f"TileMatrixSet {TILE_MATRIX_SET} not found")
+        return
+    matrices = parse_tile_matrices(tms_element)
+
+    tileset = None
+    if os.path.exists(args.tileset):
+        with open(args.tileset, 'r') as f:
+            tileset = json.load(f)
+    else:
+        print(f"Tileset {args.tileset} not found, only listing basemap tiles")
+
+    events = load_storyline(args.storyline)
+    manifest = build_manifest(events, matrices, tileset, args.layer, args.tileset_url, args)
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    print(f"Wrote prefetch manifest for {len(events)} chapters to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,139 @@
+import json
 import re
+from functools import lru_cache
 from pathlib import Path
 
-def get_amsterdam_bounds(buffer_percent=0.6):
+PROJECT_ROOT = Path(__file__).parent.parent
+REGIONS_FILE = Path(__file__).parent / "regions.json"
+
+# regions.json describes every area the pipeline can build:
+#   "default_regions": regions built when none are given on the command line
+#   "regions": {name: {
+#       "bounds": {"min_x", "max_x", "min_y", "max_y"} in RD, or
+#       "bounds_from": a source file defining const minRDX = ...; etc.,
+#       "buffer": buffer for the 3D tiles (0.6 = 60% of the size on each side),
+#       "basemap_buffers": [[max_level, buffer], ...], ascending, the last
+#                          entry applies to every finer level too
+#   }}
+# Amsterdam's basemap buffers: 400% at levels <= 10 (high buffer for
+# zoomed-out levels), 100% at 11 (increased from 50% to fix missing tiles),
+# 25% at 12 and 10% beyond that.
+# All regions share the same download and tile folders, so tiles where
+# regions overlap are only fetched and optimized once.
+
+@lru_cache(maxsize=None)
+def parse_viewer_bounds(viewer_path):
     """
-    Parses the bounds from ThreeViewer.tsx and returns them with an optional buffer.
+    Parses the bounds definitions (const minRDX = 119000;) from a source file.
     """
-    viewer_path = Path(__file__).parent.parent / "src/components/ThreeViewer.tsx"
-    
-    with open(viewer_path, 'r') as f:
+    with open(PROJECT_ROOT / viewer_path, 'r') as f:
         content = f.read()
-        
-    # Regex to find the bounds definitions
-    # const minRDX = 119000;
+
     bounds = {}
     for var in ["minRDX", "maxRDX", "minRDY", "maxRDY"]:
-        match = re.search(f"const {var} = (\d+);", content)
+        match = re.search(rf"const {var} = (\d+);", content)
         if match:
             bounds[var] = int(match.group(1))
         else:
-            raise ValueError(f"Could not find {var} in ThreeViewer.tsx")
-            
+            raise ValueError(f"Could not find {var} in {viewer_path}")
+
     # Map to the keys used in scripts
-    # min_x, max_x, min_y, max_y
-    
-    width = bounds["maxRDX"] - bounds["minRDX"]
-    height = bounds["maxRDY"] - bounds["minRDY"]
-    
+    return {
+        "min_x": bounds["minRDX"],
+        "max_x": bounds["maxRDX"],
+        "min_y": bounds["minRDY"],
+        "max_y": bounds["maxRDY"]
+    }
+
+@lru_cache(maxsize=None)
+def load_regions(regions_file=REGIONS_FILE):
+    """
+    Reads and validates regions.json once. Returns (regions, default_regions).
+    """
+    with open(regions_file, 'r') as f:
+        data = json.load(f)
+
+    regions = {}
+    for name, region in data["regions"].items():
+        if "bounds" in region:
+            bounds = {key: int(region["bounds"][key]) for key in ["min_x", "max_x", "min_y", "max_y"]}
+        elif "bounds_from" in region:
+            bounds = parse_viewer_bounds(region["bounds_from"])
+        else:
+            raise ValueError(f"Region {name} has neither bounds nor bounds_from")
+
+        regions[name] = {
+            "name": name,
+            "bounds": bounds,
+            "buffer": region.get("buffer", 0.6),
+            "basemap_buffers": [tuple(entry) for entry in region.get("basemap_buffers", [[14, 0.1]])]
+        }
+
+    default_regions = data.get("default_regions", list(regions.keys()))
+    for name in default_regions:
+        if name not in regions:
+            raise ValueError(f"Default region {name} is not defined in {regions_file}")
+
+    return regions, tuple(default_regions)
+
+def get_region(name):
+    regions, _ = load_regions()
+    if name not in regions:
+        raise ValueError(f"Unknown region {name}, expected one of: {', '.join(regions)}")
+    return regions[name]
+
+def get_region_names(names=None):
+    """
+    Returns the given region names, or the default regions if none are given.
+    """
+    regions, default_regions = load_regions()
+    names = list(names) if names else list(default_regions)
+    for name in names:
+        get_region(name)
+    return names
+
+def get_region_bounds(name, buffer_percent=None):
+    """
+    Returns the bounds of a region with a buffer, by default the region's own.
+    """
+    region = get_region(name)
+    bounds = region["bounds"]
+    if buffer_percent is None:
+        buffer_percent = region["buffer"]
+
+    width = bounds["max_x"] - bounds["min_x"]
+    height = bounds["max_y"] - bounds["min_y"]
+
     # Calculate buffer
     # buffer_percent of 4.0 means we fetch 4x the width on each side
-    effective_buffer = buffer_percent
-    
-    buffer_x = width * effective_buffer
-    buffer_y = height * effective_buffer
-    
+    buffer_x = width * buffer_percent
+    buffer_y = height * buffer_percent
+
     return {
-        "min_x": int(bounds["minRDX"] - buffer_x),
-        "max_x": int(bounds["maxRDX"] + buffer_x),
-        "min_y": int(bounds["minRDY"] - buffer_y),
-        "max_y": int(bounds["maxRDY"] + buffer_y)
+        "min_x": int(bounds["min_x"] - buffer_x),
+        "max_x": int(bounds["max_x"] + buffer_x),
+        "min_y": int(bounds["min_y"] - buffer_y),
+        "max_y": int(bounds["max_y"] + buffer_y)
     }
 
+def get_basemap_buffer(name, level_id):
+    try:
+        level = int(level_id)
+    except ValueError:
+        return 0.2 # Default
+
+    basemap_buffers = get_region(name)["basemap_buffers"]
+    for max_level, buffer_percent in basemap_buffers:
+        if level <= max_level:
+            return buffer_percent
+    return basemap_buffers[-1][1]
+
+def get_amsterdam_bounds(buffer_percent=0.6):
+    """
+    Parses the bounds from ThreeViewer.tsx and returns them with an optional buffer.
+    """
+    return get_region_bounds("amsterdam", buffer_percent)
+
 if __name__ == "__main__":
-    print("Parsed Bounds (with 20% buffer):")
-    print(get_amsterdam_bounds())
+    for name in get_region_names(load_regions()[0].keys()):
+        print(f"{name}: {get_region_bounds(name)}")
@@ -1,23 +1,26 @@
 import json
 import os
+import sys
+import argparse
 import requests
 import math
 from pathlib import Path
 try:
-    from config import get_amsterdam_bounds
+    from config import get_region_bounds, get_region_names, load_regions
 except ImportError:
-    import sys
     sys.path.append(str(Path(__file__).parent))
-    from config import get_amsterdam_bounds
+    from config import get_region_bounds, get_region_names, load_regions
 
-# Configuration
-AMSTERDAM_BOUNDS = get_amsterdam_bounds()
-print(f"Using bounds: {AMSTERDAM_BOUNDS}")
+# Override with BAG3D_BASE_URL or the first argument, e.g. to point at fixture_server.py
+BAG3D_BASE_URL = os.environ.get("BAG3D_BASE_URL", "https://data.3dbag.nl/v20250903/3dtiles/")
+LOD_NAMES = ["lod12", "lod22"]
+# Override with DATA_DIR or --data-dir, so fixture runs don't end up in data/
+DATA_DIR = os.environ.get("DATA_DIR", "data")
 
-LODS = {
-    "lod12": "https://data.3dbag.nl/v20250903/3dtiles/lod12/",
-    "lod22": "https://data.3dbag.nl/v20250903/3dtiles/lod22/"
-}
+def get_lods(base_url):
+    if not base_url.endswith("/"):
+        base_url += "/"
+    return {lod_name: f"{base_url}{lod_name}/" for lod_name in LOD_NAMES}
 
 def download_file(url, dest_path):
     if os.path.exists(dest_path):
@@ -38,7 +41,7 @@ def download_file(url, dest_path):
         print(f"Error downloading {url}: {e}")
         return False
 
-def is_in_bounds(box, offset_x, offset_y):
+def is_in_bounds(box, offset_x, offset_y, region_bounds):
     # Box is [cx, cy, cz, extent_x, 0, 0, 0, extent_y, 0, 0, 0, extent_z]
     # Center in Local Space
     cx, cy = box[0], box[1]
@@ -58,18 +61,19 @@ def is_in_bounds(box, offset_x, offset_y):
     min_box_y = world_y - radius_y
     max_box_y = world_y + radius_y
     
-    # Intersection check
-    return not (max_box_x < AMSTERDAM_BOUNDS["min_x"] or
-                min_box_x > AMSTERDAM_BOUNDS["max_x"] or
-                max_box_y < AMSTERDAM_BOUNDS["min_y"] or
-                min_box_y > AMSTERDAM_BOUNDS["max_y"])
+    # Intersection check, a tile is kept if it touches any region
+    return any(not (max_box_x < bounds["min_x"] or
+                    min_box_x > bounds["max_x"] or
+                    max_box_y < bounds["min_y"] or
+                    min_box_y > bounds["max_y"])
+               for bounds in region_bounds)
 
-def process_node(node, offset_x, offset_y, content_urls, base_url):
+def process_node(node, offset_x, offset_y, content_urls, base_url, region_bounds):
     # Check bounding volume
     if "box" in node["boundingVolume"]:
         box = node["boundingVolume"]["box"]
         
-        if is_in_bounds(box, offset_x, offset_y):
+        if is_in_bounds(box, offset_x, offset_y, region_bounds):
             if "content" in node:
                 uri = node["content"]["uri"]
                 content_urls.append(uri)
@@ -78,7 +82,7 @@ def process_node(node, offset_x, offset_y, content_urls, base_url):
                 # Filter children in place to remove those out of bounds
                 valid_children = []
                 for child in node["children"]:
-                    if process_node(child, offset_x, offset_y, content_urls, base_url):
+                    if process_node(child, offset_x, offset_y, content_urls, base_url, region_bounds):
                         valid_children.append(child)
                 node["children"] = valid_children
                 return True # This node is valid
@@ -87,13 +91,45 @@ def process_node(node, offset_x, offset_y, content_urls, base_url):
             return False # Node out of bounds
     return False
 
-def process_lod(lod_name, base_url):
+def get_stored_regions(tileset_path):
+    # Regions an earlier run pruned this tileset to, see process_lod
+    if not os.path.exists(tileset_path):
+        return []
+    try:
+        with open(tileset_path, 'r') as f:
+            return json.load(f).get("extras", {}).get("regions", [])
+    except Exception as e:
+        print(f"Could not read regions from {tileset_path}: {e}")
+        return []
+
+def get_lod_regions(tileset_path, regions):
+    # The tileset is shared by all regions, so keep every region that was
+    # already built into it, not only the ones requested this run
+    known_regions, _ = load_regions()
+    merged = list(regions)
+    for region in get_stored_regions(tileset_path):
+        if region in merged:
+            continue
+        if region not in known_regions:
+            print(f"Dropping region {region}: no longer in regions.json")
+            continue
+        merged.append(region)
+    return merged
+
+def process_lod(lod_name, base_url, regions, data_dir=DATA_DIR):
     print(f"Processing {lod_name}...")
-    output_dir = Path(f"data/amsterdam_3dtiles_{lod_name}")
+    output_dir = Path(data_dir) / f"amsterdam_3dtiles_{lod_name}"
     output_dir.mkdir(parents=True, exist_ok=True)
     
     tileset_url = base_url + "tileset.json"
     tileset_path = output_dir / "tileset.json"
+
+    regions = get_lod_regions(tileset_path, regions)
+    region_bounds = []
+    for region in regions:
+        bounds = get_region_bounds(region)
+        print(f"Using bounds for {region}: {bounds}")
+        region_bounds.append(bounds)
     
     print(f"Downloading tileset.json from {tileset_url}...")
     # Always download fresh tileset.json to ensure we start clean
@@ -118,10 +154,11 @@ def process_lod(lod_name, base_url):
     content_urls = []
     
     # Prune the tree
-    if process_node(root, offset_x, offset_y, content_urls, base_url):
+    if process_node(root, offset_x, offset_y, content_urls, base_url, region_bounds):
         print(f"Found {len(content_urls)} tiles in bounds.")
         
-        # Save pruned tileset
+        # Save pruned tileset, remembering its regions for the next run
+        tileset.setdefault("extras", {})["regions"] = regions
         with open(tileset_path, 'w') as f:
             json.dump(tileset, f, indent=2)
             
@@ -149,9 +186,25 @@ def process_lod(lod_name, base_url):
     else:
         print(f"No tiles found in bounds for {lod_name}.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download the 3DBAG LOD 1.2 and 2.2 tiles for the configured regions.")
+    parser.add_argument("base_url", nargs="?", default=BAG3D_BASE_URL,
+                        help=f"3DBAG 3D tiles base URL (default: {BAG3D_BASE_URL})")
+    parser.add_argument("--region", action="append", dest="regions",
+                        help="Region from regions.json to download, can be repeated (default: default_regions)")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help=f"Folder to write the tiles into (default: {DATA_DIR})")
+    return parser.parse_args()
+
 def main():
-    for lod_name, url in LODS.items():
-        process_lod(lod_name, url)
+    args = parse_args()
+
+    # All regions go into one pruned tileset, so tiles where regions overlap
+    # are only downloaded (and later optimized) once
+    regions = get_region_names(args.regions)
+
+    for lod_name, url in get_lods(args.base_url).items():
+        process_lod(lod_name, url, regions, args.data_dir)
 
 if __name__ == "__main__":
     main()
@@ -1,44 +1,34 @@
 import os
 import math
+import argparse
 import requests
 import xml.etree.ElementTree as ET
 import time
 from pathlib import Path
 try:
-    from config import get_amsterdam_bounds
+    from config import get_basemap_buffer, get_region_bounds, get_region_names
 except ImportError:
     # Fallback if running from root
     import sys
     sys.path.append(str(Path(__file__).parent))
-    from config import get_amsterdam_bounds
+    from config import get_basemap_buffer, get_region_bounds, get_region_names
 
 # PDOK BRT Achtergrondkaart
-WMTS_BASE_URL = "https://service.pdok.nl/brt/achtergrondkaart/wmts/v2_0"
+# Override with WMTS_BASE_URL or --base-url, e.g. to point at fixture_server.py
+WMTS_BASE_URL = os.environ.get("WMTS_BASE_URL", "https://service.pdok.nl/brt/achtergrondkaart/wmts/v2_0").rstrip("/")
 LAYERS = ["pastel", "grijs"] # Options: standaard, grijs, pastel, water
 TILE_MATRIX_SET = "EPSG:28992"
-OUTPUT_DIR = Path("data/basemap/tiles")
-CAPABILITIES_FILE = Path("data/basemap/capabilities.xml")
+# Override with DATA_DIR or --data-dir, so fixture runs don't end up in data/
+DATA_DIR = Path(os.environ.get("DATA_DIR", "data"))
+OUTPUT_DIR = DATA_DIR / "basemap/tiles"
+CAPABILITIES_FILE = DATA_DIR / "basemap/capabilities.xml"
+TARGET_LEVELS = ["00", "01", "02", "03", "04", "05", "06", "07", "08", "09", "10", "11", "12", "13", "14"]
 
 NAMESPACES = {
     "wmts": "http://www.opengis.net/wmts/1.0",
     "ows": "http://www.opengis.net/ows/1.1"
 }
 
-def get_buffer_for_level(level_id):
-    try:
-        level = int(level_id)
-    except ValueError:
-        return 0.2 # Default
-    
-    if level <= 10:
-        return 4.0 # 400% (High buffer for zoomed-out levels)
-    elif level == 11:
-        return 1.0 # 100% - Increased from 50% to fix missing tiles
-    elif level == 12:
-        return 0.25 # 25%
-    else:
-        return 0.1 # 10%
-
 def get_tile_matrix_set(root):
     for tms in root.findall(".//wmts:TileMatrixSet", NAMESPACES):
         ident = tms.find("ows:Identifier", NAMESPACES)
@@ -98,7 +88,138 @@ def download_tile(layer, tms, matrix, col, row, output_path):
         print(f"Error downloading {url}: {e}")
         return False
 
+def get_tile_range(matrix, bounds):
+    min_col = math.floor((bounds["min_x"] - matrix["top_left_x"]) / matrix["tile_span_x"])
+    max_col = math.floor((bounds["max_x"] - matrix["top_left_x"]) / matrix["tile_span_x"])
+    
+    min_row = math.floor((matrix["top_left_y"] - bounds["max_y"]) / matrix["tile_span_y"])
+    max_row = math.floor((matrix["top_left_y"] - bounds["min_y"]) / matrix["tile_span_y"])
+    
+    # Clamp to matrix dimensions
+    min_col = max(0, min_col)
+    max_col = min(matrix["matrix_width"] - 1, max_col)
+    min_row = max(0, min_row)
+    max_row = min(matrix["matrix_height"] - 1, max_row)
+    
+    return (min_col, max_col, min_row, max_row)
+
+def get_range_tiles(tile_range):
+    min_col, max_col, min_row, max_row = tile_range
+    return {(col, row) for col in range(min_col, max_col + 1) for row in range(min_row, max_row + 1)}
+
+def merge_ranges(a, b):
+    return (min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3]))
+
+def download_level(level_id, tiles):
+    downloaded_count = 0
+    skipped_count = 0
+    total_tiles = len(tiles) * len(LAYERS)
+    
+    for col, row in sorted(tiles):
+        for layer_name in LAYERS:
+            # Structure: data/basemap/tiles/{layer_name}/{level}/{col}/{row}.png
+            # Note: Original structure was data/basemap/tiles/{level}/{col}/{row}.png (always 'pastel')
+            
+            file_path = OUTPUT_DIR / layer_name / level_id / str(col) / f"{row}.png"
+            if download_tile(layer_name, TILE_MATRIX_SET, level_id, col, row, file_path):
+                downloaded_count += 1
+            else:
+                skipped_count += 1
+        
+        current_total = downloaded_count + skipped_count
+        if current_total % 100 == 0:
+            print(f"  Progress: {downloaded_count} downloaded, {skipped_count} skipped / {total_tiles} total...")
+    
+    return downloaded_count, skipped_count
+
+def get_cover_tiles(matrix, level_bounds, cover_levels):
+    # Tiles of one matrix covering the buffered area of every level in
+    # cover_levels, for every region. level_bounds maps each level to the
+    # buffered bounds of every region, in the same region order.
+    tiles = set()
+    for i in range(len(level_bounds[cover_levels[0]])):
+        tile_range = get_tile_range(matrix, level_bounds[cover_levels[0]][i])
+        for level_id in cover_levels[1:]:
+            tile_range = merge_ranges(tile_range, get_tile_range(matrix, level_bounds[level_id][i]))
+        # Regions share the tile folders, so a tile needed by several regions
+        # is only listed, and downloaded or synthesized, once
+        tiles |= get_range_tiles(tile_range)
+    return tiles
+
+def split_synth_levels(target_levels, base_level, matrices, level_bounds):
+    # Returns (levels to download, levels to synthesize). The download list
+    # starts at the base level, the synthesize list runs from just above the
+    # base level towards the coarsest level, in the order they must be built.
+    from synthesize_basemap import is_child_level
+
+    base_index = target_levels.index(base_level)
+    base_matrix = matrices[base_level]
+    base_count = len(get_cover_tiles(base_matrix, level_bounds, [base_level]))
+    synth_levels = []
+    for i in range(base_index - 1, -1, -1):
+        level_id = target_levels[i]
+        matrix = matrices[level_id]
+        if not is_child_level(matrix, matrices[target_levels[i + 1]]):
+            print(f"Level {level_id} does not line up with level {target_levels[i + 1]}, downloading it and coarser levels instead")
+            break
+        # Once a tile is larger than the buffered area, a synthesized tile
+        # would be mostly transparent, while PDOK serves it complete in a
+        # handful of requests
+        if any(matrix["tile_span_x"] > bounds["max_x"] - bounds["min_x"] or
+               matrix["tile_span_y"] > bounds["max_y"] - bounds["min_y"]
+               for bounds in level_bounds[level_id]):
+            print(f"Level {level_id} tiles are larger than the buffered area, downloading it and coarser levels instead")
+            break
+        # The base level has to cover the (larger) buffered area of every
+        # level built from it. Stop once that costs more downloads than
+        # synthesizing the level saves.
+        widened_count = len(get_cover_tiles(base_matrix, level_bounds, [base_level] + synth_levels + [level_id]))
+        saved_count = len(get_cover_tiles(matrix, level_bounds, [level_id]))
+        if widened_count - base_count >= saved_count:
+            print(f"Synthesizing level {level_id} needs {widened_count - base_count} more level {base_level} tiles "
+                  f"but only saves {saved_count}, downloading it and coarser levels instead")
+            break
+        base_count = widened_count
+        synth_levels.append(level_id)
+
+    synth_set = set(synth_levels)
+    download_levels = [base_level] + [level_id for level_id in target_levels if level_id not in synth_set and level_id != base_level]
+    return download_levels, synth_levels
+
+def parse_level(value):
+    # Accept "9" as well as "09"
+    try:
+        return f"{int(value):02d}"
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid level: {value}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download the PDOK basemap tiles around the configured regions.")
+    parser.add_argument("--region", action="append", dest="regions",
+                        help="Region from regions.json to download, can be repeated (default: default_regions)")
+    parser.add_argument("--synthesize-from", metavar="LEVEL", type=parse_level,
+                        help="Only download levels from LEVEL (e.g. 10) up and build the coarser levels locally from them")
+    parser.add_argument("--base-url", default=None,
+                        help=f"WMTS service to download from (default: {WMTS_BASE_URL})")
+    parser.add_argument("--data-dir", default=None,
+                        help=f"Folder to write the basemap into (default: {DATA_DIR})")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes used to synthesize tiles (default: CPU count)")
+    args = parser.parse_args()
+    if args.synthesize_from is not None and args.synthesize_from not in TARGET_LEVELS:
+        parser.error(f"--synthesize-from must be one of levels {TARGET_LEVELS[0]}-{TARGET_LEVELS[-1]}")
+    return args
+
 def main():
+    global WMTS_BASE_URL, DATA_DIR, OUTPUT_DIR, CAPABILITIES_FILE
+    args = parse_args()
+    if args.base_url:
+        WMTS_BASE_URL = args.base_url.rstrip("/")
+    if args.data_dir:
+        DATA_DIR = Path(args.data_dir)
+        OUTPUT_DIR = DATA_DIR / "basemap/tiles"
+        CAPABILITIES_FILE = DATA_DIR / "basemap/capabilities.xml"
+
     if not CAPABILITIES_FILE.exists():
         print(f"Capabilities file not found at {CAPABILITIES_FILE}. Downloading...")
         CAPABILITIES_FILE.parent.mkdir(parents=True, exist_ok=True)
@@ -127,57 +248,60 @@ def main():
     matrices = parse_tile_matrices(tms_element)
     print(f"Found {len(matrices)} tile matrices for {TILE_MATRIX_SET}")
     
-    target_levels = ["00", "01", "02", "03", "04", "05", "06", "07", "08", "09", "10", "11", "12", "13", "14"] 
-    
+    target_levels = [level_id for level_id in TARGET_LEVELS if level_id in matrices]
+    regions = get_region_names(args.regions)
+    print(f"Regions: {', '.join(regions)}")
+
+    level_bounds = {
+        level_id: [get_region_bounds(region, get_basemap_buffer(region, level_id)) for region in regions]
+        for level_id in target_levels
+    }
+    plain_tiles = {level_id: get_cover_tiles(matrices[level_id], level_bounds, [level_id]) for level_id in target_levels}
+
+    download_levels = target_levels
+    synth_levels = []
+    level_tiles = plain_tiles
+    if args.synthesize_from:
+        if args.synthesize_from not in matrices:
+            print(f"Level {args.synthesize_from} is not in {CAPABILITIES_FILE}")
+            return
+        download_levels, synth_levels = split_synth_levels(target_levels, args.synthesize_from, matrices, level_bounds)
+        if not synth_levels:
+            print("No level can be synthesized without downloading more tiles, downloading every level")
+            download_levels = target_levels
+
+    if synth_levels:
+        # The base level and every synthesized level have to cover the
+        # buffered area of all coarser levels built from them. Covering
+        # whole coarse tiles instead would mean downloading the entire
+        # country at the base level.
+        chain = [download_levels[0]] + synth_levels
+        level_tiles = dict(plain_tiles)
+        for i, level_id in enumerate(chain):
+            level_tiles[level_id] = get_cover_tiles(matrices[level_id], level_bounds, chain[i:])
+
+        plain_count = sum(len(tiles) for tiles in plain_tiles.values())
+        synth_count = sum(len(level_tiles[level_id]) for level_id in download_levels)
+        print(f"Downloading {synth_count} tiles per layer instead of {plain_count}, synthesizing levels {', '.join(synth_levels)}")
+
     total_downloaded = 0
-    
-    for level_id in target_levels:
-        if level_id not in matrices:
-            continue
-            
+
+    for level_id in download_levels:
         matrix = matrices[level_id]
-        buffer_percent = get_buffer_for_level(level_id)
-        bounds = get_amsterdam_bounds(buffer_percent=buffer_percent)
-        
-        print(f"Processing level {level_id} (Scale: {matrix['scale_denom']}) with buffer {buffer_percent*100}%")
-        
-        min_col = math.floor((bounds["min_x"] - matrix["top_left_x"]) / matrix["tile_span_x"])
-        max_col = math.floor((bounds["max_x"] - matrix["top_left_x"]) / matrix["tile_span_x"])
-        
-        min_row = math.floor((matrix["top_left_y"] - bounds["max_y"]) / matrix["tile_span_y"])
-        max_row = math.floor((matrix["top_left_y"] - bounds["min_y"]) / matrix["tile_span_y"])
-        
-        # Clamp to matrix dimensions
-        min_col = max(0, min_col)
-        max_col = min(matrix["matrix_width"] - 1, max_col)
-        min_row = max(0, min_row)
-        max_row = min(matrix["matrix_height"] - 1, max_row)
-        
-        print(f"  Tile range: Col {min_col}-{max_col}, Row {min_row}-{max_row}")
-        
-        downloaded_count = 0
-        skipped_count = 0
-        total_tiles = (max_col - min_col + 1) * (max_row - min_row + 1) * len(LAYERS)
-        
-        for col in range(min_col, max_col + 1):
-            for row in range(min_row, max_row + 1):
-                for layer_name in LAYERS:
-                    # Structure: data/basemap/tiles/{layer_name}/{level}/{col}/{row}.png
-                    # Note: Original structure was data/basemap/tiles/{level}/{col}/{row}.png (always 'pastel')
-                    
-                    file_path = OUTPUT_DIR / layer_name / level_id / str(col) / f"{row}.png"
-                    if download_tile(layer_name, TILE_MATRIX_SET, level_id, col, row, file_path):
-                        downloaded_count += 1
-                    else:
-                        skipped_count += 1
-                
-                current_total = downloaded_count + skipped_count
-                if current_total % 100 == 0:
-                    print(f"  Progress: {downloaded_count} downloaded, {skipped_count} skipped / {total_tiles} total...")
-        
+        print(f"Processing level {level_id} (Scale: {matrix['scale_denom']}), {len(level_tiles[level_id])} tiles")
+        downloaded_count, skipped_count = download_level(level_id, level_tiles[level_id])
         print(f"  Finished level {level_id}: {downloaded_count} new, {skipped_count} skipped")
         total_downloaded += downloaded_count
 
+    if synth_levels:
+        from synthesize_basemap import synthesize_level
+        child_level = download_levels[0]
+        for level_id in synth_levels:
+            print(f"Synthesizing level {level_id} from level {child_level}, {len(level_tiles[level_id])} tiles")
+            created_count, skipped_count = synthesize_level(OUTPUT_DIR, LAYERS, level_id, child_level, matrices[level_id], level_tiles[level_id], args.workers)
+            print(f"  Finished level {level_id}: {created_count} new, {skipped_count} skipped")
+            child_level = level_id
+
     print(f"Total tiles downloaded: {total_downloaded}")
 
 if __name__ == "__main__":
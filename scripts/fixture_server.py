@@ -0,0 +1,276 @@
+import argparse
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+try:
+    from config import get_amsterdam_bounds
+except ImportError:
+    import sys
+    sys.path.append(str(Path(__file__).parent))
+    from config import get_amsterdam_bounds
+
+# Local stand-in for data.3dbag.nl and the PDOK WMTS, so the download scripts
+# can be benchmarked and tested offline:
+#   python scripts/fixture_server.py --latency 50 --error-rate 0.05
+#   python scripts/download_amsterdam_lods.py http://localhost:8123/3dbag/ --data-dir /tmp/fixture-data
+#   python scripts/download_basemap.py --base-url http://localhost:8123/wmts --data-dir /tmp/fixture-data
+#
+# Always pass a separate --data-dir (or DATA_DIR): existing files are never
+# downloaded again, so fixture tiles written into data/ would end up in real
+# builds and on R2.
+#
+# Everything is generated on the fly and deterministic for a given path, so
+# repeated runs download identical data.
+
+TILE_MATRIX_SET = "EPSG:28992"
+# Real RD New parameters, levels 00-14, as published by PDOK
+RD_TOP_LEFT = (-285401.92, 903401.92)
+RD_SCALE_DENOM_00 = 12288000.0
+RD_LEVELS = 15
+TILE_SIZE = 256
+
+def build_tileset(depth, bounds):
+    # A quadtree over the Amsterdam bounds, content only in the leaves like
+    # the 3DBAG tilesets. Boxes are relative to the root transform.
+    center_x = (bounds["min_x"] + bounds["max_x"]) / 2
+    center_y = (bounds["min_y"] + bounds["max_y"]) / 2
+    half_x = (bounds["max_x"] - bounds["min_x"]) / 2
+    half_y = (bounds["max_y"] - bounds["min_y"]) / 2
+
+    def build_node(level, x, y):
+        size_x = 2 * half_x / 2 ** level
+        size_y = 2 * half_y / 2 ** level
+        cx = -half_x + (x + 0.5) * size_x
+        cy = -half_y + (y + 0.5) * size_y
+        node = {
+            "boundingVolume": {"box": [cx, cy, 25, size_x / 2, 0, 0, 0, size_y / 2, 0, 0, 0, 25]},
+            "geometricError": 2 ** (depth - level) * 4.0,
+        }
+        if level == depth:
+            node["content"] = {"uri": f"tiles/{level}/{x}/{y}.b3dm"}
+        else:
+            node["children"] = [build_node(level + 1, x * 2 + dx, y * 2 + dy) for dx in range(2) for dy in range(2)]
+        return node
+
+    root = build_node(0, 0, 0)
+    root["transform"] = [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, center_x, center_y, 0, 1]
+    return {"asset": {"version": "1.0"}, "geometricError": 2 ** depth * 8.0, "root": root}
+
+def pad(data, alignment, fill=b' '):
+    remainder = len(data) % alignment
+    return data + fill * ((alignment - remainder) % alignment)
+
+def build_b3dm(path, buildings, payload_size):
+    rng = random.Random(path)
+    attributes = []
+    for i in range(buildings):
+        attributes.append({
+            "identificatie": f"NL.IMBAG.Pand.{rng.randrange(10 ** 16):016d}",
+            "oorspronkelijkbouwjaar": rng.choice([0, rng.randint(1300, 2025)]),
+            "b3_h_maaiveld": round(rng.uniform(-2, 2), 2),
+            "b3_h_dak_max": round(rng.uniform(3, 60), 2),
+            "status": "Pand in gebruik",
+        })
+
+    ft_json = pad(json.dumps({"BATCH_LENGTH": buildings}, separators=(',', ':')).encode('utf-8'), 8)
+    bt_json = pad(json.dumps({"attributes": attributes}, separators=(',', ':')).encode('utf-8'), 8)
+
+    # Minimal GLB, with a BIN chunk standing in for the geometry
+    gltf_json = pad(json.dumps({"asset": {"version": "2.0"}, "buffers": [{"byteLength": payload_size}]}).encode('utf-8'), 4)
+    gltf_bin = pad(rng.randbytes(payload_size), 4, b'\0')
+    glb_length = 12 + 8 + len(gltf_json) + 8 + len(gltf_bin)
+    glb = (struct.pack('<4sII', b'glTF', 2, glb_length) +
+           struct.pack('<I4s', len(gltf_json), b'JSON') + gltf_json +
+           struct.pack('<I4s', len(gltf_bin), b'BIN\0') + gltf_bin)
+
+    byte_length = 28 + len(ft_json) + len(bt_json) + len(glb)
+    header = struct.pack('<4sIIIIII', b'b3dm', 1, byte_length, len(ft_json), 0, len(bt_json), 0)
+    return header + ft_json + bt_json + glb
+
+def build_png(col, row, level):
+    # Solid colour tile, encoded with zlib directly so no imaging library is needed
+    color = bytes([(col * 37 + level * 11) % 256, (row * 53 + level * 7) % 256, 200])
+    raw = b''.join(b'\0' + color * TILE_SIZE for _ in range(TILE_SIZE))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', TILE_SIZE, TILE_SIZE, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw, 9)) +
+            chunk(b'IEND', b''))
+
+def build_capabilities(layers):
+    matrices = []
+    for level in range(RD_LEVELS):
+        size = 2 ** level
+        matrices.append(f"""
+      <TileMatrix>
+        <ows:Identifier>{level:02d}</ows:Identifier>
+        <ScaleDenominator>{RD_SCALE_DENOM_00 / size}</ScaleDenominator>
+        <TopLeftCorner>{RD_TOP_LEFT[0]} {RD_TOP_LEFT[1]}</TopLeftCorner>
+        <TileWidth>{TILE_SIZE}</TileWidth>
+        <TileHeight>{TILE_SIZE}</TileHeight>
+        <MatrixWidth>{size}</MatrixWidth>
+        <MatrixHeight>{size}</MatrixHeight>
+      </TileMatrix>""")
+
+    layer_xml = "".join(f"""
+    <Layer>
+      <ows:Identifier>{layer}</ows:Identifier>
+      <TileMatrixSetLink><TileMatrixSet>{TILE_MATRIX_SET}</TileMatrixSet></TileMatrixSetLink>
+    </Layer>""" for layer in layers)
+
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Capabilities xmlns="http://www.opengis.net/wmts/1.0" xmlns:ows="http://www.opengis.net/ows/1.1" version="1.0.0">
+  <Contents>{layer_xml}
+    <TileMatrixSet>
+      <ows:Identifier>{TILE_MATRIX_SET}</ows:Identifier>{"".join(matrices)}
+    </TileMatrixSet>
+  </Contents>
+</Capabilities>
+""".encode('utf-8')
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    def route(self, parts):
+        options = self.server.options
+
+        # /3dbag/{lod}/tileset.json, /3dbag/{lod}/tiles/{level}/{x}/{y}.b3dm
+        if len(parts) >= 3 and parts[0] == "3dbag":
+            if parts[2:] == ["tileset.json"]:
+                return "application/json", json.dumps(self.server.tileset).encode('utf-8')
+            if parts[2] == "tiles" and parts[-1].endswith(".b3dm"):
+                return "application/octet-stream", build_b3dm("/".join(parts), options.buildings, options.payload_size)
+
+        # /wmts/WMTSCapabilities.xml, /wmts/{layer}/{tms}/{matrix}/{col}/{row}.png
+        if len(parts) >= 2 and parts[0] == "wmts":
+            if parts[1:] == ["WMTSCapabilities.xml"]:
+                return "application/xml", self.server.capabilities
+            if len(parts) == 6 and parts[1] in options.layers and parts[2] == TILE_MATRIX_SET and parts[5].endswith(".png"):
+                try:
+                    level, col, row = int(parts[3]), int(parts[4]), int(parts[5][:-4])
+                except ValueError:
+                    return None
+                if 0 <= level < RD_LEVELS and 0 <= col < 2 ** level and 0 <= row < 2 ** level:
+                    return "image/png", build_png(col, row, level)
+        return None
+
+    def do_GET(self):
+        options = self.server.options
+        rng = self.server.rng
+
+        if options.latency > 0 or options.jitter > 0:
+            time.sleep((options.latency + rng.uniform(0, options.jitter)) / 1000)
+
+        roll = rng.random()
+        if roll < options.rate_429:
+            return self.send_status(429, {"Retry-After": "1"})
+        if roll < options.rate_429 + options.error_rate:
+            return self.send_status(rng.choice([500, 502, 503]))
+
+        result = self.route([p for p in self.path.split("?")[0].split("/") if p])
+        if result is None:
+            return self.send_status(404)
+
+        content_type, body = result
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if rng.random() < options.truncate_rate:
+            # Promise the full body, send half and hang up
+            self.write_throttled(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.write_throttled(body)
+
+    def send_status(self, code, headers=None):
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def write_throttled(self, data):
+        bandwidth = self.server.options.bandwidth
+        if bandwidth <= 0:
+            self.wfile.write(data)
+            return
+        # Bandwidth cap per connection, in KB/s
+        chunk_size = 8192
+        delay = chunk_size / (bandwidth * 1024)
+        for i in range(0, len(data), chunk_size):
+            self.wfile.write(data[i:i + chunk_size])
+            time.sleep(delay)
+
+class LockedRandom(random.Random):
+    # Handler threads share one seeded generator
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.lock = threading.Lock()
+
+    def random(self):
+        with self.lock:
+            return super().random()
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+def create_server(options):
+    server = ThreadingHTTPServer((options.host, options.port), FixtureHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.rng = LockedRandom(options.seed)
+    server.tileset = build_tileset(options.depth, get_amsterdam_bounds())
+    server.capabilities = build_capabilities(options.layers)
+    return server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic 3DBAG tileset and PDOK WMTS for offline download tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--depth", type=int, default=3, help="Depth of the tileset quadtree (4^depth b3dm tiles)")
+    parser.add_argument("--buildings", type=int, default=50, help="Buildings per b3dm batch table")
+    parser.add_argument("--payload-size", type=int, default=64 * 1024, help="Bytes of dummy geometry per b3dm")
+    parser.add_argument("--layers", nargs="+", default=["pastel", "grijs"])
+    parser.add_argument("--latency", type=float, default=0, help="Added latency per request in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="Random extra latency up to this many ms")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Bandwidth cap per connection in KB/s (0 = unlimited)")
+    parser.add_argument("--rate-429", type=float, default=0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with 500/502/503")
+    parser.add_argument("--truncate-rate", type=float, default=0, help="Fraction of responses cut off halfway")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser.parse_args(argv)
+
+def main():
+    options = parse_args()
+    server = create_server(options)
+    base = f"http://{options.host}:{options.port}"
+    print(f"Serving fixtures on {base}")
+    print(f"  3DBAG: {base}/3dbag/  ({4 ** options.depth} tiles per LOD)")
+    print(f"  WMTS:  {base}/wmts")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
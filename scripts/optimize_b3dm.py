@@ -3,6 +3,29 @@ import json
 import os
 import sys
 
+def parse_year(value):
+    try:
+        year = int(value)
+    except (TypeError, ValueError):
+        return None
+    return year if year > 0 else None
+
+def get_year_range(attributes):
+    # Returns (min_year, max_year, has_unknown) for the buildings in a tile.
+    # Buildings without a valid year are always drawn by the shader, so we
+    # only flag them instead of letting them widen the range.
+    min_year = None
+    max_year = None
+    has_unknown = False
+    for obj in attributes:
+        year = parse_year(obj.get('oorspronkelijkbouwjaar')) if isinstance(obj, dict) else None
+        if year is None:
+            has_unknown = True
+            continue
+        min_year = year if min_year is None else min(min_year, year)
+        max_year = year if max_year is None else max(max_year, year)
+    return (min_year, max_year, has_unknown)
+
 def optimize_file(file_path):
     with open(file_path, 'rb') as f:
         data = f.read()
@@ -11,7 +34,7 @@ def optimize_file(file_path):
     magic = data[0:4]
     if magic != b'b3dm':
         print(f"Skipping {file_path}: Not a b3dm file.")
-        return
+        return None
 
     version = struct.unpack('<I', data[4:8])[0]
     byte_length = struct.unpack('<I', data[8:12])[0]
@@ -66,6 +89,7 @@ def optimize_file(file_path):
                     new_attributes.append(new_obj)
                 
                 bt_json['attributes'] = new_attributes
+                year_range = get_year_range(new_attributes)
                 
                 # Reserialize
                 new_bt_json_str = json.dumps(bt_json, separators=(',', ':'))
@@ -86,6 +110,11 @@ def optimize_file(file_path):
                 new_bt_json_bytes += b' ' * padding
                 
                 new_bt_json_len = len(new_bt_json_bytes)
+
+                if new_bt_json_bytes == bt_json_data:
+                    # Already optimized, e.g. shared with a region built earlier
+                    print(f"Skipping {file_path}: Already optimized.")
+                    return year_range
                 
                 # Reconstruct
                 new_byte_length = 28 + ft_json_len + ft_bin_len + new_bt_json_len + bt_bin_len + len(glb_data)
@@ -105,9 +134,72 @@ def optimize_file(file_path):
                 original_mb = byte_length / 1024 / 1024
                 new_mb = new_byte_length / 1024 / 1024
                 print(f"Optimized {file_path}: {original_mb:.2f} MB -> {new_mb:.2f} MB ({(1 - new_mb/original_mb)*100:.1f}%)")
+                return year_range
 
         except Exception as e:
             print(f"Error optimizing {file_path}: {e}")
+    return None
+
+def merge_year_ranges(ranges):
+    min_year = None
+    max_year = None
+    has_unknown = False
+    for r_min, r_max, r_unknown in ranges:
+        if r_min is not None:
+            min_year = r_min if min_year is None else min(min_year, r_min)
+        if r_max is not None:
+            max_year = r_max if max_year is None else max(max_year, r_max)
+        has_unknown = has_unknown or r_unknown
+    return (min_year, max_year, has_unknown)
+
+def annotate_node(node, tileset_dir, year_ranges):
+    # Writes the construction-year range of a node and all its descendants
+    # into node["extras"], so the client can skip subtrees that are entirely
+    # in the future for the selected year.
+    # Content without a known range (missing file, failed optimize, no
+    # attributes) counts as unknown, so no ancestor can be culled by year.
+    ranges = []
+    content = node.get("content")
+    if content:
+        uri = content.get("uri", content.get("url"))
+        file_path = os.path.abspath(os.path.join(tileset_dir, uri)) if uri else None
+        ranges.append(year_ranges.get(file_path, (None, None, True)))
+
+    for child in node.get("children", []):
+        child_range = annotate_node(child, tileset_dir, year_ranges)
+        if child_range is not None:
+            ranges.append(child_range)
+
+    if not ranges:
+        return None
+
+    min_year, max_year, has_unknown = merge_year_ranges(ranges)
+    extras = node.setdefault("extras", {})
+    extras["bouwjaarMin"] = min_year
+    extras["bouwjaarMax"] = max_year
+    extras["bouwjaarUnknown"] = has_unknown
+    return (min_year, max_year, has_unknown)
+
+def find_tileset(path):
+    # Tiles live in <lod>/tiles/, the tileset.json next to that folder
+    directory = path if os.path.isdir(path) else os.path.dirname(path)
+    for candidate in [directory, os.path.dirname(os.path.normpath(directory))]:
+        tileset_path = os.path.join(candidate, "tileset.json")
+        if os.path.isfile(tileset_path):
+            return tileset_path
+    return None
+
+def annotate_tileset(tileset_path, year_ranges):
+    with open(tileset_path, 'r') as f:
+        tileset = json.load(f)
+
+    root_range = annotate_node(tileset["root"], os.path.dirname(tileset_path), year_ranges)
+
+    with open(tileset_path, 'w') as f:
+        json.dump(tileset, f, indent=2)
+
+    if root_range is not None:
+        print(f"Annotated {tileset_path} with bouwjaar range {root_range[0]}-{root_range[1]}")
 
 def main():
     if len(sys.argv) > 1:
@@ -115,10 +207,20 @@ def main():
         if os.path.isfile(path):
             optimize_file(path)
         elif os.path.isdir(path):
+            year_ranges = {}
             for root, dirs, files in os.walk(path):
                 for file in files:
                     if file.endswith(".b3dm"):
-                        optimize_file(os.path.join(root, file))
+                        file_path = os.path.join(root, file)
+                        year_range = optimize_file(file_path)
+                        if year_range is not None:
+                            year_ranges[os.path.abspath(file_path)] = year_range
+
+            # Only a full directory run knows every tile, so only then roll the
+            # ranges up into the tileset
+            tileset_path = find_tileset(path)
+            if tileset_path and year_ranges:
+                annotate_tileset(tileset_path, year_ranges)
     else:
         print("Usage: python optimize_b3dm.py <file_or_directory>")
 
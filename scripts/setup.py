@@ -2,6 +2,7 @@ import subprocess
 import sys
 import os
 import shutil
+import argparse
 from pathlib import Path
 
 def load_env_file():
@@ -51,23 +52,36 @@ def run_script(script_name, args=None, is_node=False):
     print(f"--- Finished {script_name} ---\n")
 
 def main():
+    parser = argparse.ArgumentParser(description="Download, process and upload the map data.")
+    parser.add_argument("--region", action="append", dest="regions",
+                        help="Region from regions.json to build, can be repeated (default: default_regions)")
+    args = parser.parse_args()
+    region_args = []
+    for region in args.regions or []:
+        region_args.extend(["--region", region])
+
     print("Starting setup...")
     
     load_env_file()
     check_env_vars()
     
     # 1. Download Basemap
-    run_script("download_basemap.py")
+    run_script("download_basemap.py", args=region_args)
     
     # 2. Download LOD 1.2 and 2.2
-    run_script("download_amsterdam_lods.py")
+    # All regions share the same tile folders, so the steps below process
+    # tiles where regions overlap only once
+    run_script("download_amsterdam_lods.py", args=region_args)
+
+    # 3. Index the full building attributes before optimizing strips them
+    run_script("build_attribute_index.py", args=["data/amsterdam_3dtiles_lod22/tiles/"])
 
-    # 3. Optimize B3DM files
+    # 4. Optimize B3DM files
     print("Optimization will strip unused attributes to reduce file size.")
     run_script("optimize_b3dm.py", args=["data/amsterdam_3dtiles_lod12/tiles/"])
     run_script("optimize_b3dm.py", args=["data/amsterdam_3dtiles_lod22/tiles/"])
     
-    # 4. Upload to R2
+    # 5. Upload to R2
     # ask if user wants to upload
     user_input = input("Do you want to upload the map data to R2 now? (y/n): ")
     if user_input.lower() == 'y':
@@ -0,0 +1,84 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# Builds the coarser basemap levels locally instead of downloading them.
+#
+# In EPSG:28992 every level halves the scale of the previous one and shares
+# its top left corner, so tile (col, row) at level N covers exactly the
+# 2x2 tiles (2col..2col+1, 2row..2row+1) at level N+1. Mosaicing those four
+# children and averaging every 2x2 pixel block gives the parent tile.
+# Children that were never downloaded stay transparent, so download_basemap.py
+# stops synthesizing at levels whose tiles are larger than the buffered area.
+
+def is_child_level(parent, child):
+    # Only synthesize when the children line up exactly with the parent
+    return (math.isclose(parent["scale_denom"], child["scale_denom"] * 2, rel_tol=1e-6) and
+            math.isclose(parent["top_left_x"], child["top_left_x"]) and
+            math.isclose(parent["top_left_y"], child["top_left_y"]) and
+            parent["tile_width"] == child["tile_width"] and
+            parent["tile_height"] == child["tile_height"])
+
+def load_tile(path):
+    if not path.exists():
+        return None
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGBA"))
+
+def synthesize_tile(args):
+    tiles_dir, layer, parent_level, child_level, col, row, width, height = args
+    output_path = Path(tiles_dir) / layer / parent_level / str(col) / f"{row}.png"
+    child_paths = [
+        (dx, dy, Path(tiles_dir) / layer / child_level / str(col * 2 + dx) / f"{row * 2 + dy}.png")
+        for dx in range(2)
+        for dy in range(2)
+    ]
+    # Rebuild when a child is newer, e.g. after another region's tiles were
+    # downloaded next to it, so the shared coarse levels pick those up
+    if output_path.exists():
+        output_mtime = output_path.stat().st_mtime
+        if not any(path.exists() and path.stat().st_mtime > output_mtime for _, _, path in child_paths):
+            return False # Skipped
+
+    mosaic = np.zeros((height * 2, width * 2, 4), dtype=np.uint8)
+    found = False
+    for dx, dy, child_path in child_paths:
+        child = load_tile(child_path)
+        if child is None or child.shape[:2] != (height, width):
+            continue
+        mosaic[dy * height:(dy + 1) * height, dx * width:(dx + 1) * width] = child
+        found = True
+
+    if not found:
+        return False
+
+    # Average every 2x2 block, weighted by alpha so missing children don't
+    # darken the edges of the parent tile
+    blocks = mosaic.reshape(height, 2, width, 2, 4).astype(np.float32)
+    alpha = blocks[..., 3:4]
+    alpha_sum = alpha.sum(axis=(1, 3))
+    rgb = (blocks[..., :3] * alpha).sum(axis=(1, 3)) / np.maximum(alpha_sum, 1)
+    out = np.empty((height, width, 4), dtype=np.uint8)
+    out[..., :3] = np.clip(np.rint(rgb), 0, 255)
+    out[..., 3] = np.clip(np.rint(alpha_sum[..., 0] / 4), 0, 255)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(out, "RGBA").save(output_path, optimize=True)
+    return True
+
+def synthesize_level(tiles_dir, layers, parent_level, child_level, matrix, tiles, workers=None):
+    jobs = [
+        (str(tiles_dir), layer, parent_level, child_level, col, row, matrix["tile_width"], matrix["tile_height"])
+        for col, row in sorted(tiles)
+        for layer in layers
+    ]
+
+    created_count = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for created in executor.map(synthesize_tile, jobs, chunksize=16):
+            if created:
+                created_count += 1
+    return created_count, len(jobs) - created_count
@@ -37,7 +37,8 @@ const s3 = new S3Client({
 const foldersToUpload = [
     'data/amsterdam_3dtiles_lod12',
     'data/amsterdam_3dtiles_lod22',
-    'data/basemap'
+    'data/basemap',
+    'data/building_attributes'
 ];
 
 // Set to store existing keys mapped to their size